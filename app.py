@@ -1,14 +1,14 @@
 import os
+import queue
 import sqlite3
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, g, render_template, request, jsonify, send_file
 import threading
-import time
 from datetime import datetime, timedelta
-import pandas as pd
-import io
+import tempfile
+import xlsxwriter
 
 try:
-    from gmail_reader import GmailReader, save_contacts_to_database, get_database_stats
+    from gmail_reader import GmailReader, create_contacts_database, save_contacts_to_database, get_database_stats
 except ImportError as e:
     print(f"Import error: {e}")
     print("Trying alternative import...")
@@ -17,7 +17,10 @@ except ImportError as e:
         def __init__(self):
             raise Exception("GmailReader not available - check gmail_reader.py")
     
-    def save_contacts_to_database(contacts, db_path="contacts.db"):
+    def create_contacts_database(db_path="contacts.db"):
+        pass
+    
+    def save_contacts_to_database(contacts, db_path="contacts.db", raise_errors=False):
         return 0
     
     def get_database_stats(db_path="contacts.db"):
@@ -25,15 +28,98 @@ except ImportError as e:
 
 app = Flask(__name__)
 app.config['DATABASE'] = 'contacts.db'
+# Switched off by create_search_index if this SQLite build lacks FTS5
+app.config['FTS_ENABLED'] = True
+# Templates ship with the app, so skip the per-request mtime check and recompile
+app.config['TEMPLATES_AUTO_RELOAD'] = False
+app.jinja_env.auto_reload = False
+
+# Contacts returned per page by / and /search
+CONTACTS_PER_PAGE = 50
+
+# SQL is kept in module constants so every call hits the connection's statement cache
+CONTACTS_SQL = 'SELECT * FROM contacts ORDER BY created_at DESC LIMIT ? OFFSET ?'
+COUNT_SQL = 'SELECT COUNT(*) FROM contacts'
+
+# Rank inside the FTS5 subquery so outer filters don't defeat its early exit; the
+# inner LIMIT covers every row up to the requested page (no limit when ?2 is -1),
+# so paging and exports see the full match set
+FTS_SEARCH_SQL = '''
+    SELECT c.* FROM (
+        SELECT rowid, bm25(contacts_fts) AS r FROM contacts_fts
+        WHERE contacts_fts MATCH ?1
+        ORDER BY r, rowid LIMIT CASE WHEN ?2 < 0 THEN -1 ELSE ?2 + ?3 END
+    ) f
+    JOIN contacts c ON c.id = f.rowid
+    ORDER BY f.r, f.rowid LIMIT ?2 OFFSET ?3
+'''
+FTS_COUNT_SQL = 'SELECT COUNT(*) FROM contacts_fts WHERE contacts_fts MATCH ?1'
+
+# Substring search used when SQLite was built without FTS5
+LIKE_WHERE = r'''
+    WHERE name LIKE ?1 ESCAPE '\' OR address LIKE ?1 ESCAPE '\' OR postcode LIKE ?1 ESCAPE '\'
+       OR skills LIKE ?1 ESCAPE '\' OR other LIKE ?1 ESCAPE '\' OR email_sender LIKE ?1 ESCAPE '\'
+'''
+LIKE_SEARCH_SQL = 'SELECT * FROM contacts' + LIKE_WHERE + 'ORDER BY created_at DESC LIMIT ?2 OFFSET ?3'
+LIKE_COUNT_SQL = 'SELECT COUNT(*) FROM contacts' + LIKE_WHERE
+
+# Seconds between background Gmail checks
+POLL_INTERVAL = 300
 
 # Global variables for background processing
-is_processing = False
+# Set while processing is stopped; the background thread waits on it between checks
+_stop_event = threading.Event()
+_stop_event.set()
 last_processed = None
 processing_thread = None
 
+# One authenticated GmailReader shared by the poller and manual imports (see gmail)
+_gmail_reader = None
+_gmail_lock = threading.RLock()
+
+# Idle SQLite connections shared by request threads (see get_conn). The development
+# server starts a thread per request, so connections are pooled here rather than per thread
+DB_POOL_SIZE = 8
+_conn_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+def _connect():
+    """Open a database connection in WAL mode with tuned PRAGMAs"""
+    conn = sqlite3.connect(app.config['DATABASE'], isolation_level=None,
+                           check_same_thread=False, cached_statements=256)
+    # WAL lets the request threads read while the background thread writes
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA mmap_size=268435456')
+    conn.execute('PRAGMA cache_size=-65536')
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def get_conn():
+    """Return this request's database connection, taking an idle one from the pool if possible"""
+    if 'db' not in g:
+        try:
+            g.db = _conn_pool.get_nowait()
+        except queue.Empty:
+            g.db = _connect()
+    return g.db
+
+@app.teardown_appcontext
+def release_conn(exception=None):
+    """Hand the request's connection back to the pool, or close it if the pool is full"""
+    conn = g.pop('db', None)
+    if conn is None:
+        return
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _conn_pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
 def init_database():
     """Initialize the database"""
-    conn = sqlite3.connect(app.config['DATABASE'])
+    conn = _connect()
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS contacts (
@@ -47,80 +133,163 @@ def init_database():
     conn.commit()
     conn.close()
 
-def get_contacts(search_term=None):
-    """Get contacts from database with optional search"""
-    conn = sqlite3.connect(app.config['DATABASE'])
+def create_search_index(cursor):
+    """Create the FTS5 search index for contacts and the triggers that keep it in sync"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contacts_fts'")
+    needs_backfill = cursor.fetchone() is None
+
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5(
+                name, address, postcode, skills, other, email_sender,
+                content='contacts', content_rowid='id', tokenize='unicode61'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search unavailable, falling back to LIKE search: {e}")
+        app.config['FTS_ENABLED'] = False
+        return
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN
+            INSERT INTO contacts_fts(rowid, name, address, postcode, skills, other, email_sender)
+            VALUES (new.id, new.name, new.address, new.postcode, new.skills, new.other, new.email_sender);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN
+            INSERT INTO contacts_fts(contacts_fts, rowid, name, address, postcode, skills, other, email_sender)
+            VALUES ('delete', old.id, old.name, old.address, old.postcode, old.skills, old.other, old.email_sender);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN
+            INSERT INTO contacts_fts(contacts_fts, rowid, name, address, postcode, skills, other, email_sender)
+            VALUES ('delete', old.id, old.name, old.address, old.postcode, old.skills, old.other, old.email_sender);
+            INSERT INTO contacts_fts(rowid, name, address, postcode, skills, other, email_sender)
+            VALUES (new.id, new.name, new.address, new.postcode, new.skills, new.other, new.email_sender);
+        END
+    ''')
+
+    # Index contacts that were saved before the search table existed
+    if needs_backfill:
+        cursor.execute("INSERT INTO contacts_fts(contacts_fts) VALUES('rebuild')")
+
+def build_fts_query(search_term):
+    """Turn a search term into an FTS5 MATCH expression (each word quoted, prefix matched)"""
+    return ' '.join('"' + word.replace('"', '""') + '"*' for word in search_term.split())
+
+def escape_like(search_term):
+    """Escape LIKE wildcards so % and _ in a search term match literally"""
+    return search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def build_search(search_term):
+    """Get the search SQL and its match parameter, or (None, None) when there is nothing to search"""
+    if not search_term or not search_term.strip():
+        return None, None
+    if app.config['FTS_ENABLED']:
+        return FTS_SEARCH_SQL, build_fts_query(search_term)
+    return LIKE_SEARCH_SQL, '%' + escape_like(search_term.strip()) + '%'
+
+def get_contacts(search_term=None, limit=-1, offset=0):
+    """Get contacts from database with optional search (limit -1 means all)"""
+    conn = get_conn()
     cursor = conn.cursor()
+
+    search_sql, match = build_search(search_term)
+
+    if search_sql:
+        cursor.execute(search_sql, (match, limit, offset))
+    else:
+        cursor.execute(CONTACTS_SQL, (limit, offset))
     
-    if search_term:
-        cursor.execute('''
-            SELECT * FROM contacts 
-            WHERE name LIKE ? OR address LIKE ? OR postcode LIKE ? OR skills LIKE ? OR other LIKE ? OR email_sender LIKE ?
-            ORDER BY created_at DESC
-        ''', (f'%{search_term}%', f'%{search_term}%', f'%{search_term}%', f'%{search_term}%', f'%{search_term}%', f'%{search_term}%'))
+    return [dict(row) for row in cursor.fetchall()]
+
+def count_contacts(search_term=None):
+    """Count all contacts matching a search, not just the ones on the current page"""
+    cursor = get_conn().cursor()
+
+    _, match = build_search(search_term)
+
+    if match is None:
+        cursor.execute(COUNT_SQL)
+    elif app.config['FTS_ENABLED']:
+        cursor.execute(FTS_COUNT_SQL, (match,))
     else:
-        cursor.execute('SELECT * FROM contacts ORDER BY created_at DESC')
+        cursor.execute(LIKE_COUNT_SQL, (match,))
+
+    return cursor.fetchone()[0]
+
+def get_contacts_page(search_term=None, page=1):
+    """Get one page of contacts and whether another page follows it"""
+    # Fetch one extra row to find out if there is a next page
+    contacts = get_contacts(search_term, CONTACTS_PER_PAGE + 1, (page - 1) * CONTACTS_PER_PAGE)
+    return contacts[:CONTACTS_PER_PAGE], len(contacts) > CONTACTS_PER_PAGE
+
+def gmail():
+    """Return the shared GmailReader, authenticating on first use"""
+    global _gmail_reader
+    with _gmail_lock:
+        if _gmail_reader is None:
+            _gmail_reader = GmailReader()
+        return _gmail_reader
+
+def _poll_gmail():
+    """Check Gmail once for recent emails and save any new contacts"""
+    global last_processed
     
-    contacts = []
-    for row in cursor.fetchall():
-        contacts.append({
-            'id': row[0],
-            'name': row[1],
-            'address': row[2],
-            'postcode': row[3],
-            'skills': row[4],
-            'other': row[5],
-            'email_sender': row[6],
-            'email_subject': row[7],
-            'email_date': row[8],
-            'created_at': row[9]
-        })
+    print("Checking for NEW emails in the last 2 days...")
     
-    conn.close()
-    return contacts
+    # The shared HTTP client isn't thread-safe, so Gmail calls are serialized
+    with _gmail_lock:
+        reader = gmail()
+        # Use a time filter so background checks don't reprocess the whole inbox
+        contacts = reader.parse_recent_contact_emails(2880)  # 2880 minutes = 2 days
+    
+    if contacts:
+        # A failed save raises before the history watermark moves, so the next check retries
+        saved_count = save_contacts_to_database(contacts, app.config['DATABASE'], raise_errors=True)
+        print(f"Saved {saved_count} new contacts")
+        last_processed = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    with _gmail_lock:
+        reader.mark_recent_contacts_saved()
 
 def background_email_processing():
-    """Background thread for processing emails"""
-    global is_processing, last_processed
-    
-    while is_processing:
+    """Background thread that polls Gmail until processing is stopped"""
+    while not _stop_event.is_set():
         try:
-            print("Checking for new emails...")
-            gmail_reader = GmailReader()
-            contacts = gmail_reader.parse_recent_contact_emails(30)  # Check last 30 minutes
-            
-            if contacts:
-                saved_count = save_contacts_to_database(contacts, app.config['DATABASE'])
-                print(f"Saved {saved_count} new contacts")
-                last_processed = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
+            _poll_gmail()
         except Exception as e:
             print(f"Error processing emails: {e}")
         
-        # Wait 5 minutes before next check
-        for _ in range(300):  # 300 seconds = 5 minutes
-            if not is_processing:
-                break
-            time.sleep(1)
+        # Wait before next check, waking immediately if stopped
+        if _stop_event.wait(POLL_INTERVAL):
+            break
 
 @app.route('/')
 def index():
     """Main page"""
-    contacts = get_contacts()
+    page = max(request.args.get('page', 1, type=int), 1)
+    contacts, has_more = get_contacts_page(page=page)
     stats = get_database_stats(app.config['DATABASE'])
     
     return render_template('index.html', 
                          contacts=contacts, 
+                         page=page,
+                         has_more=has_more,
                          stats=stats,
-                         is_processing=is_processing,
+                         is_processing=not _stop_event.is_set(),
                          last_processed=last_processed)
 
 @app.route('/search')
 def search():
     """Search contacts"""
     search_term = request.args.get('q', '')
-    contacts = get_contacts(search_term)
-    return jsonify(contacts)
+    page = max(request.args.get('page', 1, type=int), 1)
+    contacts, has_more = get_contacts_page(search_term, page)
+    total = count_contacts(search_term)
+    return jsonify({'rows': contacts, 'page': page, 'has_more': has_more, 'total': total})
 
 @app.route('/stats')
 def stats():
@@ -131,13 +300,15 @@ def stats():
 @app.route('/start_processing', methods=['POST'])
 def start_processing():
     """Start background email processing"""
-    global is_processing, processing_thread
+    global processing_thread
     
-    if not is_processing:
-        is_processing = True
-        processing_thread = threading.Thread(target=background_email_processing)
-        processing_thread.daemon = True
-        processing_thread.start()
+    if _stop_event.is_set():
+        _stop_event.clear()
+        # A thread stopped in the middle of a check simply carries on looping
+        if processing_thread is None or not processing_thread.is_alive():
+            processing_thread = threading.Thread(target=background_email_processing)
+            processing_thread.daemon = True
+            processing_thread.start()
         return jsonify({'status': 'started'})
     
     return jsonify({'status': 'already_running'})
@@ -145,131 +316,106 @@ def start_processing():
 @app.route('/stop_processing', methods=['POST'])
 def stop_processing():
     """Stop background email processing"""
-    global is_processing
-    is_processing = False
+    _stop_event.set()
     return jsonify({'status': 'stopped'})
 
+def _run_full_import():
+    """Fetch ALL matching emails and save them, returning (saved_count, total_found)"""
+    with _gmail_lock:
+        contacts = gmail().parse_contact_emails()  # This will get ALL emails
+    
+    if not contacts:
+        return 0, 0
+    
+    saved_count = save_contacts_to_database(contacts, app.config['DATABASE'])
+    return saved_count, len(contacts)
+
 @app.route('/process_once', methods=['POST'])
 def process_once():
     """Process emails once manually - now does full import"""
-    try:
-        gmail_reader = GmailReader()
-        contacts = gmail_reader.parse_contact_emails()  # Get ALL emails
-        
-        if contacts:
-            saved_count = save_contacts_to_database(contacts, app.config['DATABASE'])
-            return jsonify({'status': 'success', 'processed': saved_count, 'total_found': len(contacts)})
-        else:
-            return jsonify({'status': 'success', 'processed': 0, 'total_found': 0})
-    
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)})
+    return import_all_emails()
 
-# Update the background processing to still check recent emails only
-def background_email_processing():
-    """Background thread for processing NEW emails only"""
-    global is_processing, last_processed
-    
-    # Keep the original recent email checking for background processing
-    while is_processing:
-        try:
-            print("Checking for NEW emails in the last 30 minutes...")
-            gmail_reader = GmailReader()
-            
-            # For background processing, we'll still use a time filter to avoid reprocessing everything
-            # We'll use the original method name but with a different implementation
-            contacts = gmail_reader.parse_recent_contact_emails(2880)  # Check last 30 minutes only
-            
-            if contacts:
-                saved_count = save_contacts_to_database(contacts, app.config['DATABASE'])
-                print(f"Saved {saved_count} new contacts")
-                last_processed = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-        except Exception as e:
-            print(f"Error processing emails: {e}")
-        
-        # Wait 5 minutes before next check
-        for _ in range(300):  # 300 seconds = 5 minutes
-            if not is_processing:
-                break
-            time.sleep(1)
-    
 @app.route('/import_all', methods=['POST'])
 def import_all_emails():
     """Import ALL emails from the entire inbox"""
     try:
-        gmail_reader = GmailReader()
-        contacts = gmail_reader.parse_contact_emails()  # This will get ALL emails
-        
-        if contacts:
-            saved_count = save_contacts_to_database(contacts, app.config['DATABASE'])
-            return jsonify({'status': 'success', 'processed': saved_count, 'total_found': len(contacts)})
-        else:
-            return jsonify({'status': 'success', 'processed': 0, 'total_found': 0})
+        saved_count, total_found = _run_full_import()
+        return jsonify({'status': 'success', 'processed': saved_count, 'total_found': total_found})
     
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+def get_column_widths(conn, columns, query, params):
+    """Get Excel column widths from the longest value each column has in the export query"""
+    select = ', '.join(f'MAX(LENGTH("{col}"))' for col in columns)
+    max_lengths = conn.execute(f'SELECT {select} FROM ({query})', params).fetchone()
+    return [max(length or 0, len(col)) + 2 for col, length in zip(columns, max_lengths)]
+
+def write_contacts_xlsx(conn, sheet_name, query, params):
+    """Stream the rows of an export query into a temporary .xlsx file, returned rewound"""
+    # Anonymous temp file: removed by the OS as soon as it is closed
+    output = tempfile.TemporaryFile(suffix='.xlsx')
+    
+    # constant_memory flushes each row to disk as it is written
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    
+    # Add formatting
+    header_format = workbook.add_format({
+        'bold': True,
+        'text_wrap': True,
+        'valign': 'top',
+        'fg_color': '#D7E4BC',
+        'border': 1
+    })
+    
+    # Write column headers with format
+    cursor = conn.execute(query, params)
+    columns = [description[0] for description in cursor.description]
+    worksheet.write_row(0, 0, columns, header_format)
+    
+    # Size columns from a single SQL aggregate instead of measuring every cell
+    for idx, width in enumerate(get_column_widths(conn, columns, query, params)):
+        worksheet.set_column(idx, idx, width)
+    
+    for row_num, row in enumerate(cursor, start=1):
+        worksheet.write_row(row_num, 0, row)
+    
+    workbook.close()
+    output.seek(0)
+    return output
+
+def send_xlsx(output, filename):
+    """Send an exported .xlsx file as a download"""
+    # A real file (not BytesIO) lets the WSGI server's file_wrapper use sendfile
+    response = send_file(
+        output,
+        as_attachment=True,
+        download_name=filename,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        etag=False
+    )
+    
+    # send_file can't size an open file, so set it here to allow Range requests
+    size = os.fstat(output.fileno()).st_size
+    response.content_length = size
+    return response.make_conditional(request, accept_ranges=True, complete_length=size)
+
 @app.route('/export_excel')
 def export_excel():
     """Export contacts to Excel file"""
     try:
-        # Connect to SQLite database
-        conn = sqlite3.connect(app.config['DATABASE'])
-        
-        # Read data into pandas DataFrame
-        df = pd.read_sql_query("SELECT * FROM contacts ORDER BY created_at DESC", conn)
-        
-        # Close connection
-        conn.close()
+        # Pooled connection, returned by release_conn after the request
+        conn = get_conn()
         
-        # Create Excel file in memory
-        output = io.BytesIO()
-        
-        # Create Excel writer
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            # Write DataFrame to Excel
-            df.to_excel(writer, sheet_name='Contacts', index=False)
-            
-            # Get workbook and worksheet objects
-            workbook = writer.book
-            worksheet = writer.sheets['Contacts']
-            
-            # Add some formatting
-            header_format = workbook.add_format({
-                'bold': True,
-                'text_wrap': True,
-                'valign': 'top',
-                'fg_color': '#D7E4BC',
-                'border': 1
-            })
-            
-            # Write column headers with format
-            for col_num, value in enumerate(df.columns.values):
-                worksheet.write(0, col_num, value, header_format)
-            
-            # Auto-adjust column widths
-            for idx, col in enumerate(df.columns):
-                max_len = max(
-                    df[col].astype(str).str.len().max(),
-                    len(col)
-                ) + 2
-                worksheet.set_column(idx, idx, max_len)
-        
-        # Seek to beginning of the stream
-        output.seek(0)
+        output = write_contacts_xlsx(conn, 'Contacts', CONTACTS_SQL, (-1, 0))
         
         # Create filename with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"contacts_export_{timestamp}.xlsx"
         
         # Return Excel file as download
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        return send_xlsx(output, filename)
     
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -280,61 +426,20 @@ def export_excel_filtered():
     try:
         search_term = request.args.get('q', '')
         
-        # Connect to SQLite database
-        conn = sqlite3.connect(app.config['DATABASE'])
+        # Pooled connection, returned by release_conn after the request
+        conn = get_conn()
         
-        if search_term:
+        search_sql, match = build_search(search_term)
+
+        if search_sql:
             # Use the same search logic as get_contacts()
-            query = '''
-                SELECT * FROM contacts 
-                WHERE name LIKE ? OR address LIKE ? OR postcode LIKE ? OR skills LIKE ? OR other LIKE ? OR email_sender LIKE ?
-                ORDER BY created_at DESC
-            '''
-            params = (f'%{search_term}%', f'%{search_term}%', f'%{search_term}%', f'%{search_term}%', f'%{search_term}%', f'%{search_term}%')
-            df = pd.read_sql_query(query, conn, params=params)
+            query, params = search_sql, (match, -1, 0)
         else:
             # Export all contacts if no search term
-            df = pd.read_sql_query("SELECT * FROM contacts ORDER BY created_at DESC", conn)
-        
-        # Close connection
-        conn.close()
-        
-        # Create Excel file in memory
-        output = io.BytesIO()
-        
-        # Create Excel writer
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            # Write DataFrame to Excel
-            sheet_name = 'Contacts' if not search_term else f'Contacts - "{search_term}"'
-            df.to_excel(writer, sheet_name=sheet_name[:31], index=False)  # Sheet name max 31 chars
-            
-            # Get workbook and worksheet objects
-            workbook = writer.book
-            worksheet = writer.sheets[sheet_name[:31]]
-            
-            # Add formatting
-            header_format = workbook.add_format({
-                'bold': True,
-                'text_wrap': True,
-                'valign': 'top',
-                'fg_color': '#D7E4BC',
-                'border': 1
-            })
-            
-            # Write column headers with format
-            for col_num, value in enumerate(df.columns.values):
-                worksheet.write(0, col_num, value, header_format)
-            
-            # Auto-adjust column widths
-            for idx, col in enumerate(df.columns):
-                max_len = max(
-                    df[col].astype(str).str.len().max(),
-                    len(col)
-                ) + 2
-                worksheet.set_column(idx, idx, max_len)
+            query, params = CONTACTS_SQL, (-1, 0)
         
-        # Seek to beginning of the stream
-        output.seek(0)
+        sheet_name = 'Contacts' if not search_term else f'Contacts - "{search_term}"'
+        output = write_contacts_xlsx(conn, sheet_name[:31], query, params)  # Sheet name max 31 chars
         
         # Create filename with timestamp and search term
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -344,19 +449,14 @@ def export_excel_filtered():
             filename = f"contacts_export_{timestamp}.xlsx"
         
         # Return Excel file as download
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        return send_xlsx(output, filename)
     
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 def migrate_database():
     """Add skills and message_id columns to existing database"""
-    conn = sqlite3.connect('contacts.db')
+    conn = _connect()
     cursor = conn.cursor()
     
     try:
@@ -370,10 +470,29 @@ def migrate_database():
             
         if 'message_id' not in columns:
             cursor.execute('ALTER TABLE contacts ADD COLUMN message_id TEXT')
-            # Add uniqueness constraint
-            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_message_id ON contacts(message_id)')
             print("Added message_id column")
-            
+        
+        # INSERT OR IGNORE in save_contacts_to_database relies on a unique message_id
+        # index to skip known emails; tables declared with UNIQUE already have one
+        cursor.execute('''
+            SELECT 1 FROM pragma_index_list('contacts') AS il
+            WHERE il."unique" AND (SELECT group_concat(name) FROM pragma_index_info(il.name)) = 'message_id'
+        ''')
+        # A legacy non-unique idx_message_id is replaced by create_contacts_database
+        if not cursor.fetchone():
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_message_id ON contacts(message_id)')
+
+        # Let ORDER BY created_at DESC walk an index instead of sorting; same definition as
+        # gmail_reader's create_contacts_database, and SQLite scans it backwards for DESC
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON contacts(created_at)')
+        # Earlier versions added these; they duplicate idx_created_at and the
+        # UNIQUE(email_sender, email_date, name) autoindex
+        cursor.execute('DROP INDEX IF EXISTS idx_contacts_created_at')
+        cursor.execute('DROP INDEX IF EXISTS idx_contacts_unique')
+
+        # Runs after the column migrations so the index covers skills
+        create_search_index(cursor)
+        
         conn.commit()
         print("Database migrated successfully")
             
@@ -385,4 +504,8 @@ def migrate_database():
 if __name__ == '__main__':
     init_database()
     migrate_database()
+    # Counters and indexes save_contacts_to_database relies on
+    create_contacts_database(app.config['DATABASE'])
+    # Compile the template now so the first request doesn't pay for it
+    app.jinja_env.get_template('index.html')
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
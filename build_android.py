@@ -33,7 +33,7 @@ license = "MIT"
 [tool.briefcase.app.emailprocessor]
 formal_name = "Email Processor"
 sources = ["app.py", "gmail_reader.py"]
-requirements = ["flask", "google-api-python-client", "pandas"]
+requirements = ["flask", "google-api-python-client", "xlsxwriter"]
 
 [tool.briefcase.app.emailprocessor.android]
 requires = ["android-30"]
@@ -23,6 +23,8 @@ def build_windows():
         '--hidden-import=googleapiclient',
         '--hidden-import=google.auth',
         '--hidden-import=email',
+        # Exports stream through xlsxwriter; gmail_reader runs without pandas
+        '--exclude-module=pandas',
         '--clean'
     ]
     
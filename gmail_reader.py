@@ -1,23 +1,137 @@
-import base64
+import binascii
+import functools
+import importlib.util
 import json
 import os
 import re
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
 from email.utils import parsedate_to_datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Tuple
 
+import httplib2
+from google.auth.exceptions import RefreshError
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp, Request as AuthRequest
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
 
 try:
-    import pandas as pd
-    EXCEL_SUPPORT = True
+    import re2 as _field_re  # linear-time matching, no backtracking on long bodies
 except ImportError:
-    EXCEL_SUPPORT = False
-    print("Warning: pandas library not installed. Excel export functionality will be disabled.")
+    _field_re = re
+
+# xlsxwriter is only used by export_contacts_to_excel, so importers such as the
+# web app don't pay for loading it; just check that it is available
+EXCEL_SUPPORT = importlib.util.find_spec("xlsxwriter") is not None
+
+# Timeout for Gmail HTTP calls, and how often a 429/5xx response is retried with backoff
+HTTP_TIMEOUT = 60
+NUM_RETRIES = 5
+
+# Gmail accepts at most 100 sub-requests per batch HTTP call
+BATCH_SIZE = 100
+
+# Batches in flight at once when fetching messages
+FETCH_WORKERS = 4
+
+# Batch sub-request statuses that are retried as single requests
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# A message that is gone (deleted since it was listed) isn't a failed fetch
+GONE_STATUS = 404
+
+# Partial-response masks: only the parts of each resource the parser reads
+# Parts are requested three levels deep, enough for mixed > alternative > text/plain
+_PART_FIELDS = "parts(mimeType,body/data,parts(mimeType,body/data,parts(mimeType,body/data)))"
+MESSAGE_FIELDS = f"id,payload(headers(name,value),body/data,{_PART_FIELDS})"
+METADATA_FIELDS = "id,payload/headers(name,value)"
+LIST_FIELDS = "messages/id,nextPageToken"
+HISTORY_FIELDS = "history/messagesAdded/message(id,labelIds),nextPageToken,historyId"
+
+# Labels whose messages incremental sync ignores, as a subject: search would
+SKIPPED_LABELS = frozenset({"SPAM", "TRASH"})
+
+# Rows per executemany call when saving contacts
+INSERT_CHUNK_SIZE = 10000
+
+# Imports larger than this rebuild idx_message_id once instead of updating it per row
+DEFERRED_INDEX_THRESHOLD = 5000
+
+# How long get_database_stats results are reused, keyed by database path
+STATS_CACHE_SECONDS = 30
+_stats_cache: Dict[str, Any] = {}
+
+# Contact parsing patterns, compiled once at import
+# Only start at the beginning of a run of address characters, so a long header
+# without an address is scanned once instead of retried from every offset
+_EMAIL_RE = re.compile(r'(?<![a-zA-Z0-9._%+-])[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+_LEADING_COLON_RE = re.compile(r'^:\s*')
+_WS_RE = re.compile(r'\s+')
+
+# RE2 has no lookaround, so each pattern consumes the keyword that ends its field
+# instead of looking ahead to it; group(1) is the same either way. Each field
+# takes the first of its patterns that matches anywhere in the body.
+_FIELD_PATTERN_SOURCES = {
+    "name": [
+        r"name\s*:?\s*(.+?)\s*(?:address|postcode|skills|other|from|subject|$)",
+        r"^(.+?)\s*(?:address|postcode|skills|other|from|subject|$)"
+    ],
+    "address": [
+        r"address\s*:?\s*(.+?)\s*(?:postcode|skills|other|from|subject|$)",
+        r"address\s*:?\s*(.+?)\s*postcode\s*:",
+    ],
+    "postcode": [
+        r"postcode\s*:?\s*([A-Za-z0-9\s]{2,10}?)\s*(?:skills|other|from|subject|$)",
+        r"postcode\s*:?\s*([A-Za-z0-9\s]{2,10})"
+    ],
+    "skills": [
+        r"skills\s*:?\s*(.+?)\s*(?:other|from|subject|$)",
+        r"skills\s*:?\s*(.+)"
+    ],
+    "other": [
+        r"other\s*:?\s*(.+?)\s*(?:from|subject|$)",
+        r"other\s*:?\s*(.+)"
+    ]
+}
+
+# Inline (?ims) flags are understood by both re and re2
+_FIELD_PATTERNS = {
+    field: [_field_re.compile("(?ims)" + p) for p in pattern_list]
+    for field, pattern_list in _FIELD_PATTERN_SOURCES.items()
+}
+
+# Gmail body data is URL-safe base64; map it onto the standard alphabet for binascii
+_URLSAFE_TO_STANDARD = bytes.maketrans(b'-_', b'+/')
+
+
+def _decode_body_data(data: str) -> str:
+    """Decode a Gmail body data string, replacing any invalid UTF-8."""
+    raw = data.encode('ascii')
+    raw += b'=' * (-len(raw) % 4)
+    return binascii.a2b_base64(raw.translate(_URLSAFE_TO_STANDARD)).decode('utf-8', errors='replace')
+
+
+def _search_field(cleaned_body: str, field: str) -> str:
+    """Find a contact field's value in a cleaned email body, or "" when it has none."""
+    for pattern in _FIELD_PATTERNS[field]:
+        match = pattern.search(cleaned_body)
+        if match:
+            value = _LEADING_COLON_RE.sub('', match.group(1).strip())
+            return _WS_RE.sub(' ', value)
+    return ""
+
+
+def _walk_parts(parts: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Yield MIME parts depth-first, so text/plain inside multipart/alternative is reached."""
+    for part in parts:
+        yield part
+        yield from _walk_parts(part.get("parts", ()))
 
 
 class GmailReader:
@@ -26,22 +140,41 @@ class GmailReader:
     SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
     CREDENTIALS_FILE = "credentials.json"
     TOKEN_FILE = "token.json"
+    HISTORY_FILE = "history_id.txt"
+    
+    # Credentials loaded by the first reader in this process
+    _cached_creds: Optional[Credentials] = None
     
     def __init__(self):
         """Initialize the Gmail reader with authentication."""
         self.service = None
+        self._creds = None
+        self._local = threading.local()
+        # historyId the last recent-email check reached, until its contacts are saved
+        self._pending_history_id: Optional[str] = None
         self._authenticate()
     
     def _authenticate(self) -> None:
         """Authenticate with Gmail API using OAuth2."""
-        creds = None
+        # Later readers in the same process reuse the loaded credentials instead of token.json
+        creds = GmailReader._cached_creds
         
-        if os.path.exists(self.TOKEN_FILE):
+        if creds is None and os.path.exists(self.TOKEN_FILE):
             try:
                 creds = Credentials.from_authorized_user_file(self.TOKEN_FILE, self.SCOPES)
             except Exception:
                 os.remove(self.TOKEN_FILE)
         
+        if creds and creds.expired and creds.refresh_token:
+            # An expired access token only needs the refresh token, not a new browser sign-in
+            try:
+                creds.refresh(AuthRequest(httplib2.Http(timeout=HTTP_TIMEOUT)))
+            except RefreshError:
+                creds = None
+            else:
+                with open(self.TOKEN_FILE, "w") as token_file:
+                    token_file.write(creds.to_json())
+        
         if not creds or not creds.valid:
             if not os.path.exists(self.CREDENTIALS_FILE):
                 raise FileNotFoundError(f"Credentials file '{self.CREDENTIALS_FILE}' not found.")
@@ -52,24 +185,36 @@ class GmailReader:
             with open(self.TOKEN_FILE, "w") as token_file:
                 token_file.write(creds.to_json())
         
-        self.service = build("gmail", "v1", credentials=creds)
+        GmailReader._cached_creds = creds
+        self._creds = creds
+        self._local = threading.local()
+        
+        # The discovery document ships with the client, so nothing is fetched or cached
+        self.service = build(
+            "gmail", "v1", http=self._thread_http(), static_discovery=True, cache_discovery=False
+        )
+    
+    def _thread_http(self) -> AuthorizedHttp:
+        """Return this thread's keep-alive authorized connection (httplib2 isn't thread-safe)."""
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = AuthorizedHttp(self._creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+            self._local.http = http
+        return http
     
     @staticmethod
-    def _extract_header_value(headers: list, header_name: str) -> str:
-        """Extract a specific header value from email headers."""
-        for header in headers:
-            if header["name"].lower() == header_name.lower():
-                return header["value"]
-        return "Unknown"
+    def _header_map(headers: list) -> Dict[str, str]:
+        """Map lower-cased header names to values, keeping the first of any repeats."""
+        return {header["name"].lower(): header["value"] for header in reversed(headers)}
     
     @staticmethod
+    @functools.lru_cache(maxsize=1024)  # full imports see the same senders many times
     def _extract_email_address(from_header: str) -> str:
         """Extract just the email address from the From header."""
         if not from_header:
             return "Unknown"
         
-        email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        match = re.search(email_pattern, from_header)
+        match = _EMAIL_RE.search(from_header)
         if match:
             return match.group(0).lower().strip()
         return from_header
@@ -79,17 +224,17 @@ class GmailReader:
         """Decode email body from the payload."""
         if "data" in payload.get("body", {}):
             try:
-                return base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8")
-            except Exception:
+                return _decode_body_data(payload["body"]["data"])
+            except ValueError:
                 return "Error decoding email body"
         
-        if "parts" in payload:
-            for part in payload["parts"]:
-                if part["mimeType"] == "text/plain" and "data" in part["body"]:
-                    try:
-                        return base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8")
-                    except Exception:
-                        return "Error decoding email part"
+        part = next((part for part in _walk_parts(payload.get("parts", ()))
+                     if part.get("mimeType") == "text/plain" and "data" in part.get("body", {})), None)
+        if part is not None:
+            try:
+                return _decode_body_data(part["body"]["data"])
+            except ValueError:
+                return "Error decoding email part"
         
         return "No readable content found"
     
@@ -100,43 +245,161 @@ class GmailReader:
             "name": "", "address": "", "postcode": "", "skills": "", "other": ""
         }
         
-        cleaned_body = re.sub(r'\r\n', '\n', email_body.strip())
-        
-        patterns = {
-            "name": [
-                r"name\s*:?\s*(.+?)(?=\s*(?:address|postcode|skills|other|from|subject|$))",
-                r"^(.+?)(?=\s*(?:address|postcode|skills|other|from|subject|$))"
-            ],
-            "address": [
-                r"address\s*:?\s*(.+?)(?=\s*(?:postcode|skills|other|from|subject|$))",
-                r"address\s*:?\s*(.+?)(?=\s*postcode\s*:)",
-            ],
-            "postcode": [
-                r"postcode\s*:?\s*([A-Za-z0-9\s]{2,10}?)(?=\s*(?:skills|other|from|subject|$))",
-                r"postcode\s*:?\s*([A-Za-z0-9\s]{2,10})"
-            ],
-            "skills": [
-                r"skills\s*:?\s*(.+?)(?=\s*(?:other|from|subject|$))",
-                r"skills\s*:?\s*(.+)"
-            ],
-            "other": [
-                r"other\s*:?\s*(.+?)(?=\s*(?:from|subject|$))",
-                r"other\s*:?\s*(.+)"
-            ]
-        }
+        cleaned_body = email_body.strip().replace('\r\n', '\n')
         
-        for field, pattern_list in patterns.items():
-            for pattern in pattern_list:
-                match = re.search(pattern, cleaned_body, re.IGNORECASE | re.MULTILINE | re.DOTALL)
-                if match:
-                    value = match.group(1).strip()
-                    value = re.sub(r'^:\s*', '', value)
-                    value = re.sub(r'\s+', ' ', value)
-                    contact_info[field] = value
-                    break
+        for field in contact_info:
+            contact_info[field] = _search_field(cleaned_body, field)
         
         return contact_info
     
+    @staticmethod
+    def _contact_from_email(email_data: Dict[str, str]) -> Dict[str, str]:
+        """Parse an email's body into a contact row tagged with the email it came from."""
+        # Filled in place: the parsed dict is already the row, so no second dict is built
+        contact_info = GmailReader._parse_contact_info(email_data["body"])
+        contact_info["email_sender"] = email_data["sender"]
+        contact_info["email_subject"] = email_data["subject"]
+        contact_info["email_date"] = email_data["date"]
+        contact_info["message_id"] = email_data["message_id"]
+        return contact_info
+    
+    def _build_email_data(self, message: Dict[str, Any]) -> Dict[str, str]:
+        """Turn a full Gmail message resource into an email data dict."""
+        payload = message["payload"]
+        headers = self._header_map(payload.get("headers", []))
+        from_header = headers.get("from", "Unknown")
+        
+        return {
+            "sender": self._extract_email_address(from_header),
+            "sender_full": from_header,
+            "subject": headers.get("subject", "Unknown"),
+            "date": headers.get("date", "Unknown"),
+            "body": self._decode_email_body(payload),
+            "message_id": message["id"]
+        }
+    
+    def _message_request(self, message_id: str, params: Dict[str, Any]):
+        """Build a messages.get request for one message."""
+        return self.service.users().messages().get(userId="me", id=message_id, **params)
+    
+    def _fetch_messages(self, pages: Iterable[List[str]], build_result,
+                        **params: Any) -> Tuple[List[Any], List[str]]:
+        """Fetch messages in batch HTTP requests of BATCH_SIZE, FETCH_WORKERS batches at a time.
+        
+        pages yields lists of message ids; each page's batches start as soon as it
+        arrives, so listing further pages overlaps with fetching earlier ones.
+        params go to every messages.get call and build_result turns each response
+        into the value returned for it. Also returns the ids that couldn't be
+        fetched; messages deleted in the meantime aren't counted as failures.
+        """
+        fetched: Dict[str, Any] = {}
+        failed: List[str] = []
+        
+        def _fail(message_id: str, exception: Exception) -> None:
+            print(f"Error processing email {message_id}: {exception}")
+            if not (isinstance(exception, HttpError) and exception.resp.status == GONE_STATUS):
+                failed.append(message_id)
+        
+        def _store(message_id: str, message: Dict[str, Any]) -> None:
+            try:
+                fetched[message_id] = build_result(message)
+            except Exception as e:
+                print(f"Error processing email {message_id}: {e}")
+        
+        def _fetch_one(message_id: str) -> None:
+            try:
+                _store(message_id, self._message_request(message_id, params).execute(
+                    http=self._thread_http(), num_retries=NUM_RETRIES
+                ))
+            except Exception as e:
+                _fail(message_id, e)
+        
+        def _execute(chunk: List[str]) -> Tuple[int, List[str]]:
+            """Run one batch; return its size and the ids to fetch individually."""
+            retry_ids: List[str] = []
+            
+            def _collect(request_id, response, exception):
+                if exception is None:
+                    _store(request_id, response)
+                elif isinstance(exception, HttpError) and exception.resp.status in RETRY_STATUSES:
+                    # Rate-limited or transient; fetched on its own afterwards
+                    retry_ids.append(request_id)
+                else:
+                    _fail(request_id, exception)
+            
+            batch: BatchHttpRequest = self.service.new_batch_http_request(callback=_collect)
+            for message_id in chunk:
+                batch.add(self._message_request(message_id, params), request_id=message_id)
+            try:
+                batch.execute(http=self._thread_http())
+            except Exception as e:
+                # Fall back to single requests for whatever the batch didn't deliver
+                retry_ids = [message_id for message_id in chunk if message_id not in fetched]
+                print(f"Batch request failed ({e}); fetching {len(retry_ids)} emails individually")
+            
+            return len(chunk), retry_ids
+        
+        message_ids: List[str] = []
+        futures = []
+        # Overlap batch round trips; each worker thread uses its own connection
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            for page in pages:
+                message_ids.extend(page)
+                for i in range(0, len(page), BATCH_SIZE):
+                    futures.append(executor.submit(_execute, page[i:i + BATCH_SIZE]))
+            
+            done = 0
+            single_futures = []
+            for future in as_completed(futures):
+                chunk_size, retry_ids = future.result()
+                # Single-message fallbacks are spread over the pool rather than run by one worker
+                single_futures.extend(executor.submit(_fetch_one, message_id) for message_id in retry_ids)
+                done += chunk_size
+                print(f"Processed {done}/{len(message_ids)} emails...")
+            
+            for future in as_completed(single_futures):
+                future.result()
+        
+        # Callbacks arrive in any order; keep the order Gmail listed them in
+        return [fetched[message_id] for message_id in message_ids if message_id in fetched], failed
+    
+    def _fetch_emails(self, pages: Iterable[List[str]]) -> Tuple[List[Dict[str, str]], List[str]]:
+        """Fetch full messages for the ids in pages as email data dicts, plus the ids that failed."""
+        return self._fetch_messages(pages, self._build_email_data, format="full", fields=MESSAGE_FIELDS)
+    
+    def _filter_by_subject(self, message_ids: List[str], subject_filter: str) -> Tuple[List[str], List[str]]:
+        """Keep the ids whose Subject contains subject_filter, fetching only that header.
+        
+        Also returns the ids whose headers couldn't be fetched, which are unchecked
+        rather than non-matching.
+        """
+        wanted = subject_filter.lower()
+        subjects, failed = self._fetch_messages(
+            [message_ids],
+            lambda message: (message["id"], self._header_map(message["payload"].get("headers", []))),
+            format="metadata", metadataHeaders=["Subject"], fields=METADATA_FIELDS
+        )
+        matching = [message_id for message_id, headers in subjects if wanted in headers.get("subject", "").lower()]
+        return matching, failed
+    
+    def _list_message_pages(self, query: str) -> Iterator[List[str]]:
+        """Yield the ids of messages matching query, one list page at a time."""
+        page_token = None
+        while True:
+            results = self.service.users().messages().list(
+                userId="me", 
+                q=query, 
+                maxResults=500,
+                pageToken=page_token,
+                fields=LIST_FIELDS
+            ).execute(http=self._thread_http(), num_retries=NUM_RETRIES)
+            
+            yield [message["id"] for message in results.get("messages", [])]
+            
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+    
     def get_emails_by_subject(self, subject_filter: str = "Subject Application") -> List[Dict[str, str]]:
         """Retrieve ALL emails with subject containing the filter phrase."""
         if not self.service:
@@ -144,61 +407,12 @@ class GmailReader:
         
         try:
             query = f'subject:"{subject_filter}"'
-            all_messages = []
-            page_token = None
-            
-            while True:
-                results = self.service.users().messages().list(
-                    userId="me", 
-                    q=query, 
-                    maxResults=500,
-                    pageToken=page_token
-                ).execute()
-                
-                messages = results.get("messages", [])
-                all_messages.extend(messages)
-                
-                page_token = results.get('nextPageToken')
-                if not page_token:
-                    break
+            processed_emails, _ = self._fetch_emails(self._list_message_pages(query))
             
-            if not all_messages:
+            if not processed_emails:
                 print("No emails found with the specified subject filter.")
                 return []
             
-            print(f"Found {len(all_messages)} emails with subject containing '{subject_filter}'")
-            
-            processed_emails = []
-            for i, message_info in enumerate(all_messages):
-                try:
-                    print(f"Processing email {i+1}/{len(all_messages)}...")
-                    message = self.service.users().messages().get(
-                        userId="me", 
-                        id=message_info["id"],
-                        format='full'
-                    ).execute()
-                    
-                    payload = message["payload"]
-                    headers = payload.get("headers", [])
-                    
-                    email_date = self._extract_header_value(headers, "Date")
-                    from_header = self._extract_header_value(headers, "From")
-                    sender_email = self._extract_email_address(from_header)
-                    
-                    email_data = {
-                        "sender": sender_email,
-                        "sender_full": from_header,
-                        "subject": self._extract_header_value(headers, "Subject"),
-                        "date": email_date,
-                        "body": self._decode_email_body(payload),
-                        "message_id": message_info["id"]
-                    }
-                    processed_emails.append(email_data)
-                    
-                except Exception as e:
-                    print(f"Error processing email {i+1}: {e}")
-                    continue
-            
             print(f"Successfully processed {len(processed_emails)} emails")
             return processed_emails
             
@@ -210,73 +424,132 @@ class GmailReader:
         """Retrieve ALL emails and parse them for contact information."""
         emails = self.get_emails_by_subject(subject_filter)
         
-        parsed_contacts = []
-        for email_data in emails:
-            contact_info = self._parse_contact_info(email_data["body"])
-            contact_info.update({
-                "email_sender": email_data["sender"],
-                "email_subject": email_data["subject"],
-                "email_date": email_data["date"],
-                "message_id": email_data["message_id"]
-            })
-            parsed_contacts.append(contact_info)
+        parsed_contacts = [self._contact_from_email(email_data) for email_data in emails]
         
         print(f"Parsed {len(parsed_contacts)} contacts from emails")
         return parsed_contacts
     
+    def _load_history_id(self) -> Optional[str]:
+        """Return the historyId the last recent-email check finished at, if any."""
+        if not os.path.exists(self.HISTORY_FILE):
+            return None
+        with open(self.HISTORY_FILE) as history_file:
+            return history_file.read().strip() or None
+    
+    def _save_history_id(self, history_id: str) -> None:
+        """Remember where the next recent-email check should start."""
+        with open(self.HISTORY_FILE, "w") as history_file:
+            history_file.write(str(history_id))
+    
+    def mark_recent_contacts_saved(self) -> None:
+        """Move the history watermark past the last parse_recent_contact_emails call.
+        
+        Call once its contacts are saved. Nothing changes if that check failed or
+        missed any emails, so the next check covers them again.
+        """
+        if self._pending_history_id is not None:
+            self._save_history_id(self._pending_history_id)
+            self._pending_history_id = None
+    
+    def _history_message_ids(self, start_history_id: str) -> Optional[Tuple[List[str], str]]:
+        """Ids of messages added since start_history_id, plus the mailbox's current historyId.
+        
+        Returns None when Gmail no longer keeps history that far back.
+        """
+        message_ids = []
+        seen = set()
+        page_token = None
+        try:
+            while True:
+                results = self.service.users().history().list(
+                    userId="me",
+                    startHistoryId=start_history_id,
+                    historyTypes=["messageAdded"],
+                    pageToken=page_token,
+                    fields=HISTORY_FIELDS
+                ).execute(http=self._thread_http(), num_retries=NUM_RETRIES)
+                
+                for record in results.get("history", []):
+                    for added in record.get("messagesAdded", []):
+                        message = added["message"]
+                        # Search skips spam and trash by default, so history does too
+                        if message["id"] in seen or SKIPPED_LABELS.intersection(message.get("labelIds", [])):
+                            continue
+                        seen.add(message["id"])
+                        message_ids.append(message["id"])
+                
+                page_token = results.get("nextPageToken")
+                if not page_token:
+                    return message_ids, results["historyId"]
+        except HttpError as e:
+            if e.resp.status == 404:
+                return None
+            raise
+    
     def parse_recent_contact_emails(self, minutes: int = 30) -> List[Dict[str, str]]:
-        """Retrieve recent emails only (for background processing)."""
+        """Retrieve recent emails only (for background processing).
+        
+        Once a check has succeeded and mark_recent_contacts_saved has been called,
+        the next one asks Gmail's history for just the messages added since then;
+        ``minutes`` is only searched when there is no usable historyId.
+        """
         if not self.service:
             return []
         
+        subject_filter = "Subject Application"
+        self._pending_history_id = None
+        
         try:
-            cutoff_time = datetime.now().astimezone() - timedelta(minutes=minutes)
-            cutoff_timestamp = int(cutoff_time.timestamp())
+            start_history_id = self._load_history_id()
+            history = self._history_message_ids(start_history_id) if start_history_id else None
             
-            query = f'subject:"Subject Application" after:{cutoff_timestamp}'
-            results = self.service.users().messages().list(
-                userId="me", q=query, maxResults=50
-            ).execute()
-            
-            messages = results.get("messages", [])
-            if not messages:
-                return []
+            unchecked: List[str] = []
+            if history is not None:
+                message_ids, history_id = history
+                # History can't filter by subject; check it from headers before fetching bodies
+                if message_ids:
+                    message_ids, unchecked = self._filter_by_subject(message_ids, subject_filter)
+            else:
+                # Read the historyId before searching so nothing added meanwhile is missed
+                history_id = self.service.users().getProfile(
+                    userId="me", fields="historyId"
+                ).execute(http=self._thread_http(), num_retries=NUM_RETRIES)["historyId"]
+                
+                cutoff_time = datetime.now().astimezone() - timedelta(minutes=minutes)
+                cutoff_timestamp = int(cutoff_time.timestamp())
+                
+                query = f'subject:"{subject_filter}" after:{cutoff_timestamp}'
+                results = self.service.users().messages().list(
+                    userId="me", q=query, maxResults=50, fields="messages/id"
+                ).execute(http=self._thread_http(), num_retries=NUM_RETRIES)
+                message_ids = [m["id"] for m in results.get("messages", [])]
             
-            recent_contacts = []
-            for message_info in messages:
-                try:
-                    message = self.service.users().messages().get(
-                        userId="me", 
-                        id=message_info["id"],
-                        format='full'
-                    ).execute()
-                    
-                    payload = message["payload"]
-                    headers = payload.get("headers", [])
-                    
-                    email_date = self._extract_header_value(headers, "Date")
-                    from_header = self._extract_header_value(headers, "From")
-                    sender_email = self._extract_email_address(from_header)
-                    
-                    contact_info = self._parse_contact_info(self._decode_email_body(payload))
-                    contact_info.update({
-                        "email_sender": sender_email,
-                        "email_subject": self._extract_header_value(headers, "Subject"),
-                        "email_date": email_date,
-                        "message_id": message_info["id"]
-                    })
-                    recent_contacts.append(contact_info)
-                    
-                except Exception as e:
-                    print(f"Error processing recent email: {e}")
-                    continue
+            emails, failed = self._fetch_emails([message_ids])
+            failed += unchecked
+            recent_contacts = [self._contact_from_email(email_data) for email_data in emails]
             
+            if failed:
+                # Keep the old historyId so the next check asks for these again
+                print(f"Could not fetch {len(failed)} recent emails; they will be retried on the next check")
+            else:
+                self._pending_history_id = history_id
             return recent_contacts
             
         except Exception as e:
             print(f"Error fetching recent emails: {e}")
             return []
 
+def _connect(db_path: str) -> sqlite3.Connection:
+    """Open a connection with the settings used for bulk contact writes."""
+    conn = sqlite3.connect(db_path)
+    # In WAL mode NORMAL only syncs at checkpoints, not on every commit
+    conn.execute('PRAGMA synchronous=NORMAL')
+    # Keep temp b-trees and unique-index pages in memory during INSERT OR IGNORE
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-65536')
+    conn.execute('PRAGMA mmap_size=268435456')
+    return conn
+
 
 def create_contacts_database(db_path: str = "contacts.db") -> None:
     """Create the contacts database and table if they don't exist."""
@@ -284,6 +557,9 @@ def create_contacts_database(db_path: str = "contacts.db") -> None:
         with sqlite3.connect(db_path) as conn:
             cursor = conn.cursor()
             
+            # WAL is stored in the database file, so every later connection inherits it
+            cursor.execute('PRAGMA journal_mode=WAL')
+            
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS contacts (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -294,70 +570,187 @@ def create_contacts_database(db_path: str = "contacts.db") -> None:
                 )
             ''')
             
-            # Create index for better performance
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_message_id ON contacts(message_id)')
+            # INSERT OR IGNORE in save_contacts_to_database needs exactly one unique index
+            # on message_id: the inline UNIQUE, or idx_message_id on app-created tables.
+            # Without one every save inserts duplicates; any other index on the column,
+            # unique or not, only slows inserts and large imports rebuild it each time
+            cursor.execute('''
+                SELECT il.name, il."unique", il.origin FROM pragma_index_list('contacts') AS il
+                WHERE (SELECT group_concat(name) FROM pragma_index_info(il.name)) = 'message_id'
+            ''')
+            message_id_indexes = cursor.fetchall()
+            # Keep a table constraint's index (it can't be dropped), else idx_message_id
+            unique_indexes = sorted((origin == 'c', name != 'idx_message_id', name)
+                                    for name, unique, origin in message_id_indexes if unique)
+            keep = unique_indexes[0][2] if unique_indexes else None
+            for name, _, origin in message_id_indexes:
+                if name != keep and origin == 'c':
+                    cursor.execute(f'DROP INDEX "{name}"')
+            if keep is None:
+                cursor.execute('CREATE UNIQUE INDEX idx_message_id ON contacts(message_id)')
+            
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON contacts(created_at)')
             
+            create_contact_counters(cursor)
+            
             conn.commit()
             
     except sqlite3.Error as e:
         print(f"Database creation error: {e}")
 
 
-def save_contacts_to_database(contacts: List[Dict[str, str]], db_path: str = "contacts.db") -> int:
-    """Save multiple contacts to the SQLite database."""
-    create_contacts_database(db_path)
+def create_contact_counters(cursor: sqlite3.Cursor) -> None:
+    """Create the contact_counters table and the triggers that keep its total up to date."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contact_counters'")
+    needs_backfill = cursor.fetchone() is None
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS contact_counters (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS contact_counters_ai AFTER INSERT ON contacts BEGIN
+            INSERT INTO contact_counters(key, value) VALUES ('total', 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS contact_counters_ad AFTER DELETE ON contacts BEGIN
+            UPDATE contact_counters SET value = value - 1 WHERE key = 'total';
+        END
+    ''')
+    
+    # Count contacts saved before the counters existed
+    if needs_backfill:
+        cursor.execute("INSERT INTO contact_counters(key, value) SELECT 'total', COUNT(*) FROM contacts")
+
+
+def _insert_with_deferred_index(cursor: sqlite3.Cursor, rows: List[tuple]) -> Optional[int]:
+    """Bulk insert rows with idx_message_id dropped, then rebuild it in one pass.
+    
+    Returns the number of rows saved, or None if there is no idx_message_id to defer.
+    """
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = 'idx_message_id'")
+    index = cursor.fetchone()
+    if index is None:
+        return None
+    
+    cursor.execute('''
+        CREATE TEMP TABLE import_contacts (
+            name TEXT, address TEXT, postcode TEXT, skills TEXT, other TEXT,
+            email_sender TEXT, email_subject TEXT, email_date TEXT, message_id TEXT
+        )
+    ''')
+    cursor.executemany('INSERT INTO import_contacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    cursor.execute('DROP INDEX idx_message_id')
+    
+    # Without the index, skip known and repeated message_ids with set-based subqueries
+    cursor.execute('''
+        INSERT OR IGNORE INTO contacts
+        (name, address, postcode, skills, other, email_sender, email_subject, email_date, message_id)
+        SELECT name, address, postcode, skills, other, email_sender, email_subject, email_date, message_id
+        FROM import_contacts
+        WHERE message_id IS NULL
+           OR (message_id NOT IN (SELECT message_id FROM contacts WHERE message_id IS NOT NULL)
+               AND rowid IN (SELECT MIN(rowid) FROM import_contacts GROUP BY message_id))
+    ''')
+    saved_count = cursor.rowcount
+    
+    # Recreate the index exactly as it was defined
+    cursor.execute(index[0])
+    cursor.execute('DROP TABLE import_contacts')
+    return saved_count
+
+
+def save_contacts_to_database(contacts: List[Dict[str, str]], db_path: str = "contacts.db",
+                              raise_errors: bool = False) -> int:
+    """Save multiple contacts to the SQLite database in a single transaction.
+    
+    The schema must already exist; create_contacts_database runs once at startup.
+    Database errors are printed and 0 returned, unless raise_errors is set.
+    """
+    rows = [
+        (
+            contact_info.get('name', ''),
+            contact_info.get('address', ''),
+            contact_info.get('postcode', ''),
+            contact_info.get('skills', ''),
+            contact_info.get('other', ''),
+            contact_info.get('email_sender', ''),
+            contact_info.get('email_subject', ''),
+            contact_info.get('email_date', ''),
+            # NULL rather than '' so contacts without an id never collide on the unique index
+            contact_info.get('message_id')
+        )
+        for contact_info in contacts
+    ]
     
     saved_count = 0
     try:
-        with sqlite3.connect(db_path) as conn:
+        with _connect(db_path) as conn:
             cursor = conn.cursor()
+            # Take the write lock up front rather than upgrading mid-insert
+            cursor.execute('BEGIN IMMEDIATE')
             
-            for contact_info in contacts:
-                # Use message_id for uniqueness to avoid duplicates
-                cursor.execute('''
+            if len(rows) > DEFERRED_INDEX_THRESHOLD:
+                deferred_count = _insert_with_deferred_index(cursor, rows)
+                if deferred_count is not None:
+                    rows = []
+                    saved_count = deferred_count
+            
+            # Very large imports are sent in chunks to keep each executemany call bounded
+            for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+                cursor.executemany('''
                     INSERT OR IGNORE INTO contacts 
                     (name, address, postcode, skills, other, email_sender, email_subject, email_date, message_id)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    contact_info.get('name', ''),
-                    contact_info.get('address', ''),
-                    contact_info.get('postcode', ''),
-                    contact_info.get('skills', ''),
-                    contact_info.get('other', ''),
-                    contact_info.get('email_sender', ''),
-                    contact_info.get('email_subject', ''),
-                    contact_info.get('email_date', ''),
-                    contact_info.get('message_id', '')  # Use message_id for uniqueness
-                ))
-                
-                if cursor.rowcount > 0:
-                    saved_count += 1
+                ''', rows[start:start + INSERT_CHUNK_SIZE])
+                # Ignored duplicates don't count towards rowcount
+                saved_count += cursor.rowcount
             
             conn.commit()
+        
+        if saved_count:
+            _stats_cache.pop(db_path, None)
             
     except sqlite3.Error as e:
+        if raise_errors:
+            raise
         print(f"Database save error: {e}")
+        saved_count = 0
     
     return saved_count
 
 
 def get_database_stats(db_path: str = "contacts.db") -> Dict[str, int]:
-    """Get statistics about the contacts database."""
+    """Get statistics about the contacts database, cached for STATS_CACHE_SECONDS."""
+    cached = _stats_cache.get(db_path)
+    if cached and time.monotonic() - cached[0] < STATS_CACHE_SECONDS:
+        return cached[1]
+    
+    # created_at is stored in UTC; bound date strings keep the created_at index usable
+    today = datetime.now(timezone.utc).date()
+    week_start = today - timedelta(days=7)
+    
     try:
         with sqlite3.connect(db_path) as conn:
             cursor = conn.cursor()
             
-            cursor.execute('SELECT COUNT(*) FROM contacts')
-            total_contacts = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM contacts WHERE DATE(created_at) = DATE('now')")
-            today_contacts = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM contacts WHERE created_at >= DATE('now', '-7 days')")
-            week_contacts = cursor.fetchone()[0]
+            # One statement: the counter total plus a single range scan of the past week
+            cursor.execute('''
+                SELECT
+                    COALESCE((SELECT value FROM contact_counters WHERE key = 'total'),
+                             (SELECT COUNT(*) FROM contacts)),
+                    COALESCE(SUM(created_at >= ?), 0),
+                    COUNT(*)
+                FROM contacts
+                WHERE created_at >= ?
+            ''', (today.isoformat(), week_start.isoformat()))
+            total_contacts, today_contacts, week_contacts = cursor.fetchone()
             
-            return {
+            stats = {
                 'total_contacts': total_contacts,
                 'today_contacts': today_contacts,
                 'week_contacts': week_contacts
@@ -365,6 +758,9 @@ def get_database_stats(db_path: str = "contacts.db") -> Dict[str, int]:
             
     except sqlite3.Error:
         return {'total_contacts': 0, 'today_contacts': 0, 'week_contacts': 0}
+    
+    _stats_cache[db_path] = (time.monotonic(), stats)
+    return stats
 
 
 def print_database_stats(db_path: str = "contacts.db") -> None:
@@ -377,88 +773,64 @@ def print_database_stats(db_path: str = "contacts.db") -> None:
     print("=" * 30)
 
 
-def export_contacts_to_excel(contacts: List[Dict[str, str]], filename: str = "contacts.xlsx") -> bool:
+EXPORT_COLUMNS = ['name', 'address', 'postcode', 'skills', 'other', 'email_sender', 'email_subject', 'email_date']
+
+
+def export_contacts_to_excel(filename: str = "contacts.xlsx", db_path: str = "contacts.db") -> bool:
     """
-    Export contacts to an Excel file, appending to existing file.
+    Export the contacts database to an Excel file.
+    
+    The database already deduplicates on message_id, so the workbook is written
+    straight from it rather than read back and merged. Rows are streamed in
+    xlsxwriter's constant_memory mode and the old file is replaced at the end.
     """
     if not EXCEL_SUPPORT:
-        print("Error: pandas library required for Excel export.")
+        print("Error: xlsxwriter library required for Excel export.")
         return False
     
-    if not contacts:
-        return False
+    import xlsxwriter
+    
+    temp_filename = filename + ".tmp"
+    columns = ', '.join(EXPORT_COLUMNS)
     
     try:
-        all_contacts = contacts
-        
-        if os.path.exists(filename):
-            try:
-                existing_df = pd.read_excel(filename)
-                existing_contacts = existing_df.to_dict('records')
-                
-                # Remove duplicates
-                existing_ids = set()
-                for contact in existing_contacts:
-                    identifier = (
-                        str(contact.get('name', '')).strip().lower(),
-                        str(contact.get('email_sender', '')).strip().lower(),
-                        str(contact.get('email_date', '')).strip()
-                    )
-                    existing_ids.add(identifier)
-                
-                unique_new_contacts = []
-                for contact in contacts:
-                    identifier = (
-                        str(contact.get('name', '')).strip().lower(),
-                        str(contact.get('email_sender', '')).strip().lower(),
-                        str(contact.get('email_date', '')).strip()
-                    )
-                    if identifier not in existing_ids:
-                        unique_new_contacts.append(contact)
-                
-                if unique_new_contacts:
-                    all_contacts = existing_contacts + unique_new_contacts
-                else:
-                    all_contacts = existing_contacts
-                    
-            except Exception:
-                all_contacts = contacts
-        
-        df = pd.DataFrame(all_contacts)
-        
-        # Reorder columns for better readability
-        column_order = ['name', 'address', 'postcode', 'skills', 'other', 'email_sender', 'email_subject', 'email_date']
-        available_columns = [col for col in column_order if col in df.columns]
-        df = df[available_columns]
-        
-        with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Contacts', index=False)
-            
-            worksheet = writer.sheets['Contacts']
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-            
-            worksheet.freeze_panes = 'A2'
-            worksheet.auto_filter.ref = worksheet.dimensions
+        with sqlite3.connect(db_path) as conn:
+            # Size columns from a single aggregate instead of measuring every cell
+            max_lengths = conn.execute(
+                'SELECT ' + ', '.join(f'MAX(LENGTH({col}))' for col in EXPORT_COLUMNS) + ' FROM contacts'
+            ).fetchone()
+            
+            # constant_memory flushes each row to disk as it is written
+            workbook = xlsxwriter.Workbook(temp_filename, {'constant_memory': True})
+            worksheet = workbook.add_worksheet('Contacts')
+            header_format = workbook.add_format({'bold': True, 'border': 1})
+            worksheet.write_row(0, 0, EXPORT_COLUMNS, header_format)
+            
+            for idx, (col, length) in enumerate(zip(EXPORT_COLUMNS, max_lengths)):
+                worksheet.set_column(idx, idx, min(max(length or 0, len(col)) + 2, 50))
+            
+            row_num = 0
+            for row_num, row in enumerate(conn.execute(f'SELECT {columns} FROM contacts ORDER BY id'), start=1):
+                worksheet.write_row(row_num, 0, row)
+            
+            worksheet.freeze_panes(1, 0)
+            worksheet.autofilter(0, 0, row_num, len(EXPORT_COLUMNS) - 1)
+            workbook.close()
         
+        os.replace(temp_filename, filename)
         return True
         
     except Exception as e:
         print(f"Error exporting to Excel: {e}")
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
         return False
 
 def main():
     """Main function to read emails, store in database, and export to Excel."""
     try:
+        create_contacts_database("contacts.db")
+        
         # Initialize Gmail reader
         gmail_reader = GmailReader()
         
@@ -469,17 +841,20 @@ def main():
         if contacts:
             print(f"Found {len(contacts)} new contact(s)")
             
-            # Save to database
-            saved_count = save_contacts_to_database(contacts, "contacts.db")
+            # Save to database; an error skips the watermark so the emails are read again
+            saved_count = save_contacts_to_database(contacts, "contacts.db", raise_errors=True)
             print(f"Saved {saved_count} new contacts to database")
             
-            # Export to Excel (append to existing file)
-            if export_contacts_to_excel(contacts, "contacts.xlsx"):
-                print("Contacts appended to Excel file")
+            # Refresh the Excel file from the database when it gained rows
+            if (saved_count or not os.path.exists("contacts.xlsx")) and \
+                    export_contacts_to_excel("contacts.xlsx", "contacts.db"):
+                print("Contacts exported to Excel file")
             
         else:
             print("No new emails found in the last 30 minutes")
         
+        gmail_reader.mark_recent_contacts_saved()
+        
         # Print statistics
         print_database_stats("contacts.db")
         
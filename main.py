@@ -6,6 +6,7 @@ and append new data to an Excel file with basic statistics.
 """
 
 import base64
+import binascii
 import json
 import os
 import re
@@ -20,11 +21,28 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 try:
-    import pandas as pd
+    from openpyxl import Workbook, load_workbook
+    from openpyxl.utils import get_column_letter
     EXCEL_SUPPORT = True
 except ImportError:
     EXCEL_SUPPORT = False
-    print("Warning: pandas library not installed. Excel export functionality will be disabled.")
+    print("Warning: openpyxl library not installed. Excel export functionality will be disabled.")
+
+# Gmail accepts at most 100 sub-requests per batch HTTP call
+BATCH_SIZE = 100
+
+# Batch sub-request statuses that are retried as single requests, and how often
+# each single request retries a 429/5xx response with backoff
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+NUM_RETRIES = 5
+
+# Keys per new-contact lookup; 3 parameters each stays under SQLite's 999 limit
+FILTER_CHUNK_SIZE = 300
+
+# Contact parsing pattern, compiled once at import
+# Every "field:" label in one pass; the value (rest of the line) is captured in a
+# lookahead so a second label on the same line is still found
+_CONTACT_RE = re.compile(r"(?P<field>name|address|postcode|other)\s*:\s*(?=(?P<value>.+))", re.IGNORECASE)
 
 
 class GmailReader:
@@ -59,11 +77,24 @@ class GmailReader:
             with open(self.TOKEN_FILE, "w") as token_file:
                 token_file.write(creds.to_json())
         
-        self.service = build("gmail", "v1", credentials=creds)
+        # Use the discovery document bundled with the client instead of downloading it
+        self.service = build(
+            "gmail", "v1", credentials=creds, static_discovery=True, cache_discovery=False
+        )
     
     @staticmethod
-    def _extract_header_value(headers: list, header_name: str) -> str:
-        """Extract a specific header value from email headers."""
+    def _header_map(headers: list) -> Dict[str, str]:
+        """Build a lowercase header-name lookup; the first occurrence of a name wins."""
+        header_map = {}
+        for header in headers:
+            header_map.setdefault(header["name"].lower(), header["value"])
+        return header_map
+    
+    @staticmethod
+    def _extract_header_value(headers, header_name: str) -> str:
+        """Extract a specific header value from a header list or a _header_map dict."""
+        if isinstance(headers, dict):
+            return headers.get(header_name.lower(), "Unknown")
         for header in headers:
             if header["name"].lower() == header_name.lower():
                 return header["value"]
@@ -73,48 +104,101 @@ class GmailReader:
     def _decode_email_body(payload: Dict[str, Any]) -> str:
         """Decode email body from the payload."""
         if "data" in payload.get("body", {}):
-            try:
-                return base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8")
-            except Exception:
-                return "Error decoding email body"
+            data = payload["body"]["data"]
+        else:
+            # First text/plain part with inline data
+            data = next(
+                (part["body"]["data"] for part in payload.get("parts", [])
+                 if part["mimeType"] == "text/plain" and "data" in part["body"]),
+                None
+            )
+            if data is None:
+                return "No readable content found"
         
-        if "parts" in payload:
-            for part in payload["parts"]:
-                if part["mimeType"] == "text/plain" and "data" in part["body"]:
-                    try:
-                        return base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8")
-                    except Exception:
-                        return "Error decoding email part"
+        try:
+            raw = base64.urlsafe_b64decode(data)
+        except binascii.Error:
+            return "Error decoding email body"
         
-        return "No readable content found"
+        # Malformed UTF-8 becomes U+FFFD instead of losing the whole body
+        return raw.decode("utf-8", errors="replace")
     
     @staticmethod
     def _parse_contact_info(email_body: str) -> Dict[str, str]:
         """Parse structured contact information from email body."""
         contact_info = {"name": "", "address": "", "postcode": "", "other": ""}
-        cleaned_body = re.sub(r'\r\n', '\n', email_body.strip())
+        cleaned_body = email_body.strip().replace('\r\n', '\n')
         
-        patterns = {
-            "name": r"name\s*:\s*(.+?)(?=\n|$)",
-            "address": r"address\s*:\s*(.+?)(?=\n|$)",
-            "postcode": r"postcode\s*:\s*(.+?)(?=\n|$)",
-            "other": r"other\s*:\s*(.+?)(?=\n|$)"
-        }
-        
-        for field, pattern in patterns.items():
-            match = re.search(pattern, cleaned_body, re.IGNORECASE | re.MULTILINE)
-            if match:
-                contact_info[field] = match.group(1).strip()
+        found = set()
+        for match in _CONTACT_RE.finditer(cleaned_body):
+            field = match.group("field").lower()
+            # The first label for each field wins
+            if field not in found:
+                found.add(field)
+                contact_info[field] = match.group("value").strip()
+                if len(found) == len(contact_info):
+                    break
         
         return contact_info
     
+    def _batch_get_messages(self, message_ids: List[str], **params: Any) -> Dict[str, Dict[str, Any]]:
+        """Fetch messages by id with batch HTTP requests.
+        
+        Rate-limited or transient sub-requests, and the rest of a batch whose call
+        fails, are fetched again one at a time with retries; other failures are
+        printed and skipped.
+        """
+        fetched = {}
+        retry_ids = []
+        
+        def _collect(request_id, response, exception):
+            if exception is None:
+                fetched[request_id] = response
+            elif isinstance(exception, HttpError) and exception.resp.status in RETRY_STATUSES:
+                retry_ids.append(request_id)
+            else:
+                print(f"Error fetching email {request_id}: {exception}")
+        
+        # One HTTP round trip per BATCH_SIZE messages instead of one per message
+        for start in range(0, len(message_ids), BATCH_SIZE):
+            chunk = message_ids[start:start + BATCH_SIZE]
+            batch = self.service.new_batch_http_request(callback=_collect)
+            for message_id in chunk:
+                batch.add(
+                    self.service.users().messages().get(userId="me", id=message_id, **params),
+                    request_id=message_id
+                )
+            try:
+                batch.execute()
+            except Exception as e:
+                # Earlier chunks are kept; this one's undelivered messages are fetched singly
+                missing = [message_id for message_id in chunk
+                           if message_id not in fetched and message_id not in retry_ids]
+                print(f"Batch request failed ({e}); fetching {len(missing)} emails individually")
+                retry_ids.extend(missing)
+        
+        for message_id in retry_ids:
+            try:
+                fetched[message_id] = self.service.users().messages().get(
+                    userId="me", id=message_id, **params
+                ).execute(num_retries=NUM_RETRIES)
+            except Exception as e:
+                print(f"Error fetching email {message_id}: {e}")
+        
+        return fetched
+    
     def get_recent_emails(self, minutes: int = 10, subject_filter: str = "Subject Application") -> List[Dict[str, str]]:
         """Retrieve emails from the last X minutes with subject filtering."""
         if not self.service:
             return []
         
         try:
-            query = f'subject:"{subject_filter}"'
+            # Resolved once per call; naive Date headers are read as local time
+            local_tz = datetime.now().astimezone().tzinfo
+            cutoff_time = datetime.now(local_tz) - timedelta(minutes=minutes)
+            
+            # Let Gmail drop older messages rather than fetching them to discard here
+            query = f'subject:"{subject_filter}" after:{int(cutoff_time.timestamp())}'
             results = self.service.users().messages().list(
                 userId="me", q=query, maxResults=50
             ).execute()
@@ -123,32 +207,52 @@ class GmailReader:
             if not messages:
                 return []
             
-            recent_emails = []
+            # Headers are enough for the cutoff check, so bodies are only fetched afterwards
+            metadata = self._batch_get_messages(
+                [message_info["id"] for message_info in messages],
+                format="metadata", metadataHeaders=["From", "Subject", "Date"]
+            )
+            
+            recent_headers = []
             for message_info in messages:
+                message = metadata.get(message_info["id"])
+                if message is None:
+                    continue
                 try:
-                    message = self.service.users().messages().get(userId="me", id=message_info["id"]).execute()
-                    payload = message["payload"]
-                    headers = payload.get("headers", [])
+                    headers = self._header_map(message["payload"].get("headers", []))
                     
                     email_date = self._extract_header_value(headers, "Date")
                     email_date_dt = parsedate_to_datetime(email_date)
                     
                     if email_date_dt.tzinfo is None:
-                        email_date_dt = email_date_dt.replace(tzinfo=datetime.now().astimezone().tzinfo)
-                    
-                    cutoff_time = datetime.now().astimezone() - timedelta(minutes=minutes)
+                        email_date_dt = email_date_dt.replace(tzinfo=local_tz)
                     
+                    # Safety net: the Date header can disagree with Gmail's received time
                     if email_date_dt >= cutoff_time:
-                        email_data = {
-                            "sender": self._extract_header_value(headers, "From"),
-                            "subject": self._extract_header_value(headers, "Subject"),
-                            "date": email_date,
-                            "body": self._decode_email_body(payload)
-                        }
-                        recent_emails.append(email_data)
+                        recent_headers.append((message_info["id"], headers, email_date))
                 except Exception:
                     continue
             
+            if not recent_headers:
+                return []
+            
+            full_messages = self._batch_get_messages(
+                [message_id for message_id, _, _ in recent_headers], format="full"
+            )
+            
+            recent_emails = []
+            for message_id, headers, email_date in recent_headers:
+                message = full_messages.get(message_id)
+                if message is None:
+                    continue
+                email_data = {
+                    "sender": self._extract_header_value(headers, "From"),
+                    "subject": self._extract_header_value(headers, "Subject"),
+                    "date": email_date,
+                    "body": self._decode_email_body(message["payload"])
+                }
+                recent_emails.append(email_data)
+            
             return recent_emails
             
         except Exception:
@@ -160,88 +264,138 @@ class GmailReader:
         
         parsed_contacts = []
         for email_data in emails:
-            contact_info = self._parse_contact_info(email_data["body"])
-            contact_info.update({
+            parsed_contacts.append({
+                **self._parse_contact_info(email_data["body"]),
                 "email_sender": email_data["sender"],
                 "email_subject": email_data["subject"],
                 "email_date": email_data["date"]
             })
-            parsed_contacts.append(contact_info)
         
         return parsed_contacts
 
 
-def create_contacts_database(db_path: str = "contacts.db") -> None:
-    """Create the contacts database and table if they don't exist."""
-    try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS contacts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT, address TEXT, postcode TEXT, other TEXT,
-                    email_sender TEXT, email_subject TEXT, email_date TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(email_sender, email_date, name)
-                )
-            ''')
-            
-            conn.commit()
-            
-    except sqlite3.Error as e:
-        print(f"Database creation error: {e}")
-
-
-def save_contacts_to_database(contacts: List[Dict[str, str]], db_path: str = "contacts.db") -> int:
-    """Save multiple contacts to the SQLite database."""
-    create_contacts_database(db_path)
+class ContactsDB:
+    """A single SQLite connection shared by the contact save and stats calls."""
     
-    saved_count = 0
-    try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            
-            for contact_info in contacts:
-                cursor.execute('''
+    def __init__(self, db_path: str = "contacts.db"):
+        """Open the database and make sure the contacts table exists."""
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self._apply_pragmas()
+        self._init_schema()
+    
+    def _apply_pragmas(self) -> None:
+        """Apply the PRAGMAs used for contact writes."""
+        # WAL is stored in the database file; the rest are per-connection
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode NORMAL only syncs at checkpoints, not on every commit
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA temp_store=MEMORY')
+        self.conn.execute('PRAGMA cache_size=-20000')
+    
+    def _init_schema(self) -> None:
+        """Create the contacts table if it doesn't exist."""
+        try:
+            with self.conn:
+                self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS contacts (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        name TEXT, address TEXT, postcode TEXT, other TEXT,
+                        email_sender TEXT, email_subject TEXT, email_date TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE(email_sender, email_date, name)
+                    )
+                ''')
+                # The web app's name for it; earlier versions created idx_contacts_created_at
+                self.conn.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON contacts(created_at)')
+                self.conn.execute('DROP INDEX IF EXISTS idx_contacts_created_at')
+                
+        except sqlite3.Error as e:
+            print(f"Database creation error: {e}")
+    
+    @staticmethod
+    def _new_contacts(cursor: sqlite3.Cursor, contacts: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Return the contacts whose UNIQUE key isn't stored yet, dropping repeats within the list."""
+        keys = [
+            (
+                contact_info.get('email_sender', ''),
+                contact_info.get('email_date', ''),
+                contact_info.get('name', '')
+            )
+            for contact_info in contacts
+        ]
+        
+        seen_keys = set()
+        # Join each chunk of keys against the UNIQUE(email_sender, email_date, name)
+        # index in one statement instead of a lookup per contact
+        for start in range(0, len(keys), FILTER_CHUNK_SIZE):
+            chunk = keys[start:start + FILTER_CHUNK_SIZE]
+            placeholders = ', '.join(['(?, ?, ?)'] * len(chunk))
+            cursor.execute(f'''
+                SELECT c.email_sender, c.email_date, c.name
+                FROM (VALUES {placeholders}) AS k
+                JOIN contacts c
+                  ON c.email_sender = k.column1 AND c.email_date = k.column2 AND c.name = k.column3
+            ''', [value for key in chunk for value in key])
+            seen_keys.update(cursor.fetchall())
+        
+        new_contacts = []
+        for contact_info, key in zip(contacts, keys):
+            if key not in seen_keys:
+                seen_keys.add(key)
+                new_contacts.append(contact_info)
+        
+        return new_contacts
+    
+    def save_contacts(self, contacts: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Save multiple contacts in a single transaction and return the ones actually inserted."""
+        new_contacts = []
+        try:
+            with self.conn:
+                cursor = self.conn.cursor()
+                # Take the write lock before checking keys so the check and insert agree
+                cursor.execute('BEGIN IMMEDIATE')
+                new_contacts = self._new_contacts(cursor, contacts)
+                cursor.executemany('''
                     INSERT OR IGNORE INTO contacts 
                     (name, address, postcode, other, email_sender, email_subject, email_date)
                     VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    contact_info.get('name', ''),
-                    contact_info.get('address', ''),
-                    contact_info.get('postcode', ''),
-                    contact_info.get('other', ''),
-                    contact_info.get('email_sender', ''),
-                    contact_info.get('email_subject', ''),
-                    contact_info.get('email_date', '')
-                ))
+                ''', [
+                    (
+                        contact_info.get('name', ''),
+                        contact_info.get('address', ''),
+                        contact_info.get('postcode', ''),
+                        contact_info.get('other', ''),
+                        contact_info.get('email_sender', ''),
+                        contact_info.get('email_subject', ''),
+                        contact_info.get('email_date', '')
+                    )
+                    for contact_info in new_contacts
+                ])
                 
-                if cursor.rowcount > 0:
-                    saved_count += 1
-            
-            conn.commit()
-            
-    except sqlite3.Error as e:
-        print(f"Database save error: {e}")
+        except sqlite3.Error as e:
+            print(f"Database save error: {e}")
+            return []
+        
+        return new_contacts
     
-    return saved_count
-
-
-def get_database_stats(db_path: str = "contacts.db") -> Dict[str, int]:
-    """Get statistics about the contacts database."""
-    try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT COUNT(*) FROM contacts')
-            total_contacts = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM contacts WHERE DATE(created_at) = DATE('now')")
-            today_contacts = cursor.fetchone()[0]
+    def get_stats(self) -> Dict[str, int]:
+        """Get statistics about the contacts database."""
+        try:
+            cursor = self.conn.cursor()
             
-            cursor.execute("SELECT COUNT(*) FROM contacts WHERE created_at >= DATE('now', '-7 days')")
-            week_contacts = cursor.fetchone()[0]
+            # One pass over the created_at index; "today" is written as a range so the
+            # index stays usable instead of wrapping created_at in DATE()
+            cursor.execute('''
+                SELECT COUNT(*),
+                       SUM(created_at >= DATE('now')),
+                       SUM(created_at >= DATE('now', '-7 days'))
+                FROM contacts
+            ''')
+            total_contacts, today_contacts, week_contacts = cursor.fetchone()
+            # SUM over an empty table is NULL
+            today_contacts = today_contacts or 0
+            week_contacts = week_contacts or 0
             
             return {
                 'total_contacts': total_contacts,
@@ -249,93 +403,87 @@ def get_database_stats(db_path: str = "contacts.db") -> Dict[str, int]:
                 'week_contacts': week_contacts
             }
             
-    except sqlite3.Error:
-        return {'total_contacts': 0, 'today_contacts': 0, 'week_contacts': 0}
+        except sqlite3.Error:
+            return {'total_contacts': 0, 'today_contacts': 0, 'week_contacts': 0}
+    
+    def print_stats(self) -> None:
+        """Print database statistics."""
+        stats = self.get_stats()
+        print("=== Database Statistics ===")
+        print(f"Total Contacts: {stats['total_contacts']}")
+        print(f"New Today: {stats['today_contacts']}")
+        print(f"This Week: {stats['week_contacts']}")
+        print("=" * 30)
+    
+    def close(self) -> None:
+        """Close the database connection."""
+        self.conn.close()
 
 
-def print_database_stats(db_path: str = "contacts.db") -> None:
-    """Print database statistics."""
-    stats = get_database_stats(db_path)
-    print("=== Database Statistics ===")
-    print(f"Total Contacts: {stats['total_contacts']}")
-    print(f"New Today: {stats['today_contacts']}")
-    print(f"This Week: {stats['week_contacts']}")
-    print("=" * 30)
+EXPORT_COLUMNS = ['name', 'address', 'postcode', 'other', 'email_sender', 'email_subject', 'email_date']
 
 
 def export_contacts_to_excel(contacts: List[Dict[str, str]], filename: str = "contacts.xlsx") -> bool:
     """
     Export contacts to an Excel file, appending to existing file.
+    
+    Contacts are expected to be new (deduplicated against the database), so they
+    are appended to the sheet rather than merged with a re-read copy of it.
     """
     if not EXCEL_SUPPORT:
-        print("Error: pandas library required for Excel export.")
+        print("Error: openpyxl library required for Excel export.")
         return False
     
     if not contacts:
         return False
     
     try:
-        all_contacts = contacts
-        
+        workbook = None
         if os.path.exists(filename):
             try:
-                existing_df = pd.read_excel(filename)
-                existing_contacts = existing_df.to_dict('records')
-                
-                # Remove duplicates
-                existing_ids = set()
-                for contact in existing_contacts:
-                    identifier = (
-                        str(contact.get('name', '')).strip().lower(),
-                        str(contact.get('email_sender', '')).strip().lower(),
-                        str(contact.get('email_date', '')).strip()
-                    )
-                    existing_ids.add(identifier)
-                
-                unique_new_contacts = []
-                for contact in contacts:
-                    identifier = (
-                        str(contact.get('name', '')).strip().lower(),
-                        str(contact.get('email_sender', '')).strip().lower(),
-                        str(contact.get('email_date', '')).strip()
-                    )
-                    if identifier not in existing_ids:
-                        unique_new_contacts.append(contact)
-                
-                if unique_new_contacts:
-                    all_contacts = existing_contacts + unique_new_contacts
-                else:
-                    all_contacts = existing_contacts
-                    
+                workbook = load_workbook(filename)
+                worksheet = workbook['Contacts'] if 'Contacts' in workbook.sheetnames else workbook.active
             except Exception:
-                all_contacts = contacts
+                workbook = None
         
-        df = pd.DataFrame(all_contacts)
+        # Column widths come from one pass over the new contacts, not a scan of every cell
+        widths = [len(column) for column in EXPORT_COLUMNS]
+        for contact in contacts:
+            for index, column in enumerate(EXPORT_COLUMNS):
+                value = contact.get(column, '')
+                length = len(value) if isinstance(value, str) else len(str(value))
+                if length > widths[index]:
+                    widths[index] = length
         
-        # Reorder columns for better readability
-        column_order = ['name', 'address', 'postcode', 'other', 'email_sender', 'email_subject', 'email_date']
-        available_columns = [col for col in column_order if col in df.columns]
-        df = df[available_columns]
-        
-        with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Contacts', index=False)
+        if workbook is None:
+            # New file: stream rows through a write-only workbook, which keeps no cells in memory
+            workbook = Workbook(write_only=True)
+            worksheet = workbook.create_sheet('Contacts')
+            for index, width in enumerate(widths, 1):
+                worksheet.column_dimensions[get_column_letter(index)].width = min(width + 2, 50)
+            worksheet.freeze_panes = 'A2'
+            worksheet.auto_filter.ref = f"A1:{get_column_letter(len(EXPORT_COLUMNS))}{len(contacts) + 1}"
             
-            worksheet = writer.sheets['Contacts']
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
+            worksheet.append(EXPORT_COLUMNS)
+            for contact in contacts:
+                worksheet.append([contact.get(column, '') for column in EXPORT_COLUMNS])
             
-            worksheet.freeze_panes = 'A2'
-            worksheet.auto_filter.ref = worksheet.dimensions
+            workbook.save(filename)
+            return True
+        
+        # Existing file: append the new rows
+        for contact in contacts:
+            worksheet.append([contact.get(column, '') for column in EXPORT_COLUMNS])
+        
+        # Existing widths already fit the earlier rows, so they only ever grow
+        for index, width in enumerate(widths, 1):
+            dimension = worksheet.column_dimensions[get_column_letter(index)]
+            dimension.width = max(dimension.width or 0, min(width + 2, 50))
         
+        worksheet.freeze_panes = 'A2'
+        worksheet.auto_filter.ref = worksheet.dimensions
+        
+        workbook.save(filename)
         return True
         
     except Exception as e:
@@ -345,10 +493,14 @@ def export_contacts_to_excel(contacts: List[Dict[str, str]], filename: str = "co
 
 def main():
     """Main function to read emails, store in database, and export to Excel."""
+    contacts_db = None
     try:
         # Initialize Gmail reader
         gmail_reader = GmailReader()
         
+        # One connection for the whole run
+        contacts_db = ContactsDB("contacts.db")
+        
         # Check for new emails in the last 30 minutes
         print("Checking for new emails in the last 30 minutes...")
         contacts = gmail_reader.parse_recent_contact_emails(30)
@@ -356,25 +508,28 @@ def main():
         if contacts:
             print(f"Found {len(contacts)} new contact(s)")
             
-            # Save to database
-            saved_count = save_contacts_to_database(contacts, "contacts.db")
-            print(f"Saved {saved_count} new contacts to database")
+            # Save to database; only rows it didn't already have come back
+            new_contacts = contacts_db.save_contacts(contacts)
+            print(f"Saved {len(new_contacts)} new contacts to database")
             
-            # Export to Excel (append to existing file)
-            if export_contacts_to_excel(contacts, "contacts.xlsx"):
+            # Export to Excel (append to existing file), skipped when nothing was new
+            if new_contacts and export_contacts_to_excel(new_contacts, "contacts.xlsx"):
                 print("Contacts appended to Excel file")
             
         else:
             print("No new emails found in the last 30 minutes")
         
         # Print statistics
-        print_database_stats("contacts.db")
+        contacts_db.print_stats()
         
     except FileNotFoundError as e:
         print(f"Setup error: {e}")
         print("Make sure you have downloaded credentials.json from Google Cloud Console.")
     except Exception as e:
         print(f"Application error: {e}")
+    finally:
+        if contacts_db is not None:
+            contacts_db.close()
 
 
 if __name__ == "__main__":